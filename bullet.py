@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 
 import curses
+import os
+import re
+import sys
+from functools import lru_cache
 from pathlib import Path
+from time import monotonic
 
 INDENT = 2
+INDENT_STRING = " " * INDENT
 FILESTRING = "list.txt"
 FILENAME = (
     Path(__file__).parent.joinpath(FILESTRING).absolute()
@@ -11,6 +17,21 @@ FILENAME = (
     else Path(FILESTRING)
 )
 AUTOSAVE = True
+AUTOSAVE_DELAY = 0.5  # seconds between autosaves
+BULLET_SYMBOLS = (
+    "•",
+    "◦",
+    "▪",
+    # "▫",
+)
+
+# start of a line that is neither empty nor (indented) `-`
+_INVALID_BULLET = re.compile(r"^(?![^\S\n]*-|$)", re.MULTILINE)
+
+_dirty = False
+_first_dirty_row = 0  # rows above this are known to match the file on disk
+_last_save = 0.0
+_trailing_newline = False  # written back after the last row so the file keeps it
 
 
 class FileValidationError(Exception):
@@ -18,26 +39,33 @@ class FileValidationError(Exception):
 
 
 class Cursor:
-    def __init__(self, relative_position: int, current_line: int):
+    __slots__ = ("x", "y", "indents")
+
+    def __init__(self, relative_position: int, current_line: int, indents: list):
         self.x = relative_position
         self.y = current_line
+        self.indents = indents  # non-text length of every row, kept in sync by edits
 
-    def get_nontext_length(self, bullets: list):
-        return get_whitespace_len(bullets[self.y]) + 2
+    def get_nontext_length(self):
+        return self.indents[self.y]
 
-    def right(self, bullets, characters=1):
-        characters = clamp(characters, 1, len(bullets[self.y]) - 1)
-        if self.x + characters <= len(bullets[self.y]) - 1:
+    def update_nontext_length(self, bullets: list):
+        self.indents[self.y] = get_whitespace_len(bullets[self.y]) + 2
+
+    def right(self, bullets: list, characters=1):
+        row_length = len(bullets[self.y])
+        characters = clamp(characters, 1, row_length - 1)
+        if self.x + characters <= row_length - 1:
             self.x += characters
             return
         if self.y + 1 >= len(bullets):
             return
         self.y += 1
-        self.x = max(self.get_nontext_length(bullets), 0)
+        self.x = max(self.get_nontext_length(), 0)
 
-    def left(self, bullets, characters=1):
+    def left(self, bullets: list, characters=1):
         characters = clamp(characters, 1, len(bullets[self.y]) - 1)
-        if self.x - characters >= self.get_nontext_length(bullets):
+        if self.x - characters >= self.get_nontext_length():
             self.x -= characters
             return
         if self.y - 1 < 0:
@@ -45,23 +73,23 @@ class Cursor:
         self.y -= 1
         self.x = len(bullets[self.y]) - 1
 
-    def up(self, bullets, characters=1):
+    def up(self, bullets: list, characters=1):
         if self.y - characters < 0:
             return
         self.y -= characters
         self.x = clamp(
             self.x,
-            self.get_nontext_length(bullets),
+            self.get_nontext_length(),
             len(bullets[self.y]),
         )
 
-    def down(self, bullets, characters=1):
+    def down(self, bullets: list, characters=1):
         if self.y + characters >= len(bullets):
             return
         self.y += characters
         self.x = clamp(
             self.x,
-            self.get_nontext_length(bullets),
+            self.get_nontext_length(),
             len(bullets[self.y]),
         )
 
@@ -75,19 +103,17 @@ def clamp(counter: int, minimum: int, maximum: int):
 
 
 def format_bullet(bullet: str):
-    symbols = [
-        "•",
-        "◦",
-        "▪",
-        # "▫",
-    ]
     return bullet.replace(
         "-",
-        symbols[(len(bullet) - len(bullet.lstrip())) // INDENT % len(symbols)],
+        BULLET_SYMBOLS[get_whitespace_len(bullet) // INDENT % len(BULLET_SYMBOLS)],
         1,
     )
 
 
+# the row under the cursor changes on every keypress, so it bypasses the cache
+_format_bullet_cached = lru_cache(maxsize=4096)(format_bullet)
+
+
 def get_args():
     import argparse
 
@@ -129,98 +155,206 @@ def get_args():
 
 
 def handle_args(args):
-    global INDENT, FILENAME, AUTOSAVE
+    global INDENT, INDENT_STRING, FILENAME, AUTOSAVE
     INDENT = args.indentation_level
+    INDENT_STRING = " " * INDENT
     FILENAME = Path(args.filename)
     AUTOSAVE = args.autosave
 
 
 def read_file(filename: Path):
-    if not filename.exists():
-        with filename.open("w") as f:
-            return ""
-    with filename.open() as f:
-        return f.read()
+    try:
+        return filename.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        filename.touch()
+        return ""
 
 
 def validate_file(data: str):
-    for index, bullet in enumerate(data.split("\n"), start=1):
-        if not bullet:
-            continue
-        if not bullet.strip().startswith("-"):
-            raise FileValidationError(
-                f"The bullet on line {index} doesn't start with a `-`"
-            )
-            # TODO: allow multiline bullets
-    return data.split("\n")
-
-
-def make_printable_sublist(height: int, lst: list, cursor: int):
-    if len(lst) < height:
-        return lst, cursor
+    global _trailing_newline
+    invalid = _INVALID_BULLET.search(data)
+    if invalid is not None:
+        index = data.count("\n", 0, invalid.start()) + 1
+        raise FileValidationError(
+            f"The bullet on line {index} doesn't start with a `-`"
+        )
+        # TODO: allow multiline bullets
+    bullets = data.split("\n")
+    _trailing_newline = len(bullets) > 1 and not bullets[-1]
+    if _trailing_newline:  # not a blank row, just the end of the last line
+        bullets.pop()
+    return bullets
+
+
+def make_printable_window(height: int, length: int, cursor: int):
+    if length < height:
+        return 0, length, cursor
     start = max(0, cursor - height // 2)
-    end = min(len(lst), start + height)
+    end = min(length, start + height)
     if end - start < height:
         if start == 0:
-            end = min(len(lst), height)
+            end = min(length, height)
         else:
             start = max(0, end - height)
-    sublist = lst[start:end]
     cursor -= start
-    return sublist, cursor
-
-
-def print_bullets(stdscr, bullets, cursor: Cursor):
-    bullets_list, _ = make_printable_sublist(
-        stdscr.getmaxyx()[0] - 1, bullets, cursor.y
-    )
-    for row, bullet in enumerate(bullets_list):
-        for col, char in enumerate(format_bullet(bullet)):
-            stdscr.addstr(
-                row,
-                col,
-                char,
-                curses.A_REVERSE if row == cursor.y and col == cursor.x else 0,
-            )
-
-
-def update_file(filename, bullets, save=AUTOSAVE):
-    if not save:
-        return 0
-    with filename.open("w") as f:
-        return f.write("\n".join(bullets))
-
-
-def quit_program(bullets):
-    return update_file(FILENAME, bullets, True)
+    return start, end, cursor
+
+
+def print_bullets(
+    stdscr,
+    bullets: list,
+    cursor: Cursor,
+    height: int,
+    dirty_rows=None,
+    start=None,
+    highlighted=None,
+):
+    new_start, end, cursor_row = make_printable_window(height, len(bullets), cursor.y)
+    if dirty_rows is None or new_start != start:  # scrolled: repaint everything
+        stdscr.erase()
+        rows = range(new_start, end)
+    else:
+        rows = [row for row in dirty_rows if start <= row < end]
+        if (
+            highlighted is not None
+            and start <= highlighted[0] < end
+            and highlighted[1] >= 0
+        ):
+            # moving the cursor only needs the old cell switched back to normal
+            stdscr.chgat(highlighted[0] - start, highlighted[1], 1, curses.A_NORMAL)
+    for row in rows:
+        # clear first: a row that fills the width leaves the cursor on the next row
+        stdscr.move(row - new_start, 0)
+        stdscr.clrtoeol()
+        stdscr.addstr(
+            row - new_start,
+            0,
+            (
+                format_bullet(bullets[row])
+                if row == cursor.y
+                else _format_bullet_cached(bullets[row])
+            ),
+        )
+    if cursor.x >= 0:  # arrows can walk off an emptied row, chgat would raise
+        stdscr.chgat(cursor_row, cursor.x, 1, curses.A_REVERSE)
+    stdscr.noutrefresh()
+    return new_start
+
+
+def update_file(fd: int, bullets: list, row=0):
+    # only rewrite the file from the first row that may have changed
+    row = max(0, min(row, len(bullets) - 1))
+    head = "\n".join(bullets[:row])
+    # str.isascii() is O(1), and ASCII text is as long in bytes as in characters
+    offset = len(head) if head.isascii() else len(head.encode())
+    tail = bullets[row:]
+    if row:  # the old file may end right before this row's newline
+        tail.insert(0, "")
+    if _trailing_newline:
+        tail.append("")
+    data = "\n".join(tail).encode()
+    os.pwrite(fd, data, offset)
+    os.ftruncate(fd, offset + len(data))
+    return len(data)
+
+
+def save(fd: int, bullets: list):
+    global _dirty, _first_dirty_row
+    written = update_file(fd, bullets, _first_dirty_row)
+    _dirty = False
+    _first_dirty_row = len(bullets)
+    return written
+
+
+def mark_dirty(row: int):
+    global _dirty, _first_dirty_row
+    _dirty = True
+    _first_dirty_row = min(_first_dirty_row, row)
+
+
+def autosave(fd: int, bullets: list):
+    # returns the getch timeout in ms: until pending edits are due, else block
+    global _last_save
+    if not AUTOSAVE or not _dirty:
+        return -1
+    remaining = _last_save + AUTOSAVE_DELAY - monotonic()
+    if remaining > 0:
+        return int(remaining * 1000) + 1
+    save(fd, bullets)
+    _last_save = monotonic()
+    return -1
+
+
+def quit_program(fd: int, bullets: list):
+    written = save(fd, bullets) if _dirty else 0
+    os.fsync(fd)
+    return written
 
 
 def add_bullet(bullets: list, cursor):
     bullets.insert(
         cursor.y + 1,
-        bullets[cursor.y][: get_whitespace_len(bullets[cursor.y]) + 2] + " ",
+        bullets[cursor.y][: cursor.get_nontext_length()] + " ",
     )
     cursor.y += 1
-    return bullets
+    cursor.indents.insert(cursor.y, get_whitespace_len(bullets[cursor.y]) + 2)
+    cursor.x = cursor.get_nontext_length()
+    mark_dirty(cursor.y)
 
 
 def indent(bullets: list, cursor):
-    bullets[cursor.y] = " " * INDENT + bullets[cursor.y]
+    bullets[cursor.y] = INDENT_STRING + bullets[cursor.y]
     cursor.x += INDENT
-    return bullets
+    cursor.update_nontext_length(bullets)
+    mark_dirty(cursor.y)
 
 
 def dedent(bullets: list, cursor):
-    if get_whitespace_len(bullets[cursor.y]) > 0:
+    if cursor.get_nontext_length() > 2:
         bullets[cursor.y] = bullets[cursor.y][INDENT:]
         cursor.x -= INDENT
-    return bullets
+        cursor.update_nontext_length(bullets)
+        mark_dirty(cursor.y)
 
 
 def delete(bullets: list, cursor):
+    if len(bullets) == 1:  # keep a row for the cursor to stand on
+        return
     bullets.pop(cursor.y)
-    cursor.y -= 1
-    return bullets
+    cursor.indents.pop(cursor.y)
+    mark_dirty(cursor.y)
+    cursor.y = max(cursor.y - 1, 0)
+    cursor.x = cursor.get_nontext_length()
+
+
+def backspace(bullets: list, cursor):
+    if cursor.x <= 0:
+        return
+    current_row = bullets[cursor.y]
+    bullets[cursor.y] = current_row[: cursor.x - 1] + current_row[cursor.x :]
+    cursor.x -= 1
+    cursor.update_nontext_length(bullets)
+    mark_dirty(cursor.y)
+
+
+def insert_char(bullets: list, cursor, char: str):
+    current_row = bullets[cursor.y]
+    bullets[cursor.y] = current_row[: cursor.x] + char + current_row[cursor.x :]
+    if cursor.x < len(bullets[cursor.y]):
+        cursor.x += 1
+    cursor.update_nontext_length(bullets)
+    mark_dirty(cursor.y)
+
+
+KEY_HANDLERS = {
+    353: dedent,  # shift + tab
+    10: add_bullet,  # enter
+    9: indent,  # tab
+    4: delete,  # ^D
+    8: backspace,
+    127: backspace,
+    263: backspace,
+}
 
 
 def main(stdscr):
@@ -228,66 +362,76 @@ def main(stdscr):
     curses.curs_set(0)
 
     bullets = validate_file(read_file(FILENAME))
-    cursor = Cursor(get_whitespace_len(bullets[0]) + 2, 0)
-
-    while True:
-        print_bullets(stdscr, bullets, cursor)
-        try:
-            key = stdscr.getch()
-        except KeyboardInterrupt:  # exit on ^C
-            return quit_program(bullets)
-        if key == 3:  # ^C
-            return quit_program(bullets)
-        elif key == 27:  # any escape sequence
-            stdscr.nodelay(True)
-            if stdscr.getch() == -1:  # escape, otherwise skip `[`
-                return quit_program(bullets)
-            stdscr.nodelay(False)
-            # try:
-            #     subch = stdscr.getch()
-            # except KeyboardInterrupt:
-            #     return quit_program(bullets)
-            # # set stty -ixon
-            # if subch == 83:  # ^S
-            #     raise NotImplementedError
-        elif key == 353:  # shift + tab
-            bullets = dedent(bullets, cursor)
-            stdscr.clear()
-        elif key == 10:  # enter
-            bullets = add_bullet(bullets, cursor)
-            stdscr.clear()
-        elif key == 9:  # tab
-            bullets = indent(bullets, cursor)
-            stdscr.clear()
-        elif key == 4:  # ^D
-            bullets = delete(bullets, cursor)
-            stdscr.clear()
-        elif key == 259:  # up
-            cursor.up(bullets)
-        elif key == 258:  # down
-            cursor.down(bullets)
-        elif key == 260:  # left
-            cursor.left(bullets)
-        elif key == 261:  # right
-            cursor.right(bullets)
-        elif key in (8, 127, 263):  # backspace
-            if cursor.x <= 0:
+    indents = [get_whitespace_len(bullet) + 2 for bullet in bullets]
+    cursor = Cursor(indents[0], 0, indents)
+    moves = {
+        259: cursor.up,
+        258: cursor.down,
+        260: cursor.left,
+        261: cursor.right,
+    }
+
+    # keep the file open for the whole session instead of reopening it per save
+    fd = os.open(FILENAME, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        height = stdscr.getmaxyx()[0] - 1
+        dirty_rows = None
+        start = None
+        highlighted = None
+        while True:
+            # nothing to redraw after no-ops
+            if dirty_rows is None or dirty_rows or highlighted != (cursor.y, cursor.x):
+                start = print_bullets(
+                    stdscr, bullets, cursor, height, dirty_rows, start, highlighted
+                )
+                curses.doupdate()
+                dirty_rows = set()
+                highlighted = (cursor.y, cursor.x)
+            stdscr.timeout(autosave(fd, bullets))
+            try:
+                key = stdscr.getch()
+            except KeyboardInterrupt:  # exit on ^C
+                return quit_program(fd, bullets)
+            move = moves.get(key)
+            if move is not None:  # arrows only move the highlight
+                move(bullets)
+                continue
+            rows_before = len(bullets)
+            handler = KEY_HANDLERS.get(key)
+            if handler is not None:
+                handler(bullets, cursor)
+            elif key == -1:  # autosave timeout, nothing was typed
+                continue
+            elif key == 3:  # ^C
+                return quit_program(fd, bullets)
+            elif key == 27:  # any escape sequence
+                stdscr.nodelay(True)
+                if stdscr.getch() == -1:  # escape, otherwise skip `[`
+                    return quit_program(fd, bullets)
+                stdscr.nodelay(False)
+                continue
+                # try:
+                #     subch = stdscr.getch()
+                # except KeyboardInterrupt:
+                #     return quit_program(fd, bullets)
+                # # set stty -ixon
+                # if subch == 83:  # ^S
+                #     raise NotImplementedError
+            elif key == 410:  # terminal resized
+                height = stdscr.getmaxyx()[0] - 1
+                dirty_rows = None
                 continue
-            current_row = list(bullets[cursor.y])
-            current_row.pop(cursor.x - 1)
-            bullets[cursor.y] = "".join(current_row)
-            cursor.x -= 1
-            stdscr.clear()
-        else:  # typable characters (basically alphanum)
-            current_row = list(bullets[cursor.y])
-            current_row.insert(cursor.x, chr(key))
-            bullets[cursor.y] = "".join(current_row)
-            if cursor.x < len(bullets[cursor.y]):
-                cursor.x += 1
-            stdscr.clear()
-        stdscr.refresh()
+            else:  # typable characters (basically alphanum)
+                insert_char(bullets, cursor, chr(key))
+            if len(bullets) != rows_before:  # rows shifted
+                dirty_rows = None
+            else:
+                dirty_rows.add(cursor.y)
+    finally:
+        os.close(fd)
 
 
 if __name__ == "__main__":
-    handle_args(get_args())
+    if len(sys.argv) > 1:  # the defaults already match an empty command line
+        handle_args(get_args())
     curses.wrapper(main)